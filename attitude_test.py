@@ -23,12 +23,13 @@ config['window_title'] = 'attitude_test'
 env = BaseDroneEnv(base_config)
 obs, _ = env.reset()
 
-masses = np.array([env.drone_params[i]['mass'] for i in range(num_drones)])
+params = env.drone_params_array  # columns ordered as DRONE_PARAM_NAMES
+masses = params[:, 0].copy()
 if config['pendulum']:
-    masses = masses + [env.drone_params[i]['weight_mass'] for i in range(num_drones)]
-    masses = masses + 0.2*np.array([env.drone_params[i]['pendulum_len'] for i in range(num_drones)])
+    masses = masses + params[:, 5]
+    masses = masses + 0.2*params[:, 4]
 
-forces = np.array([env.drone_params[i]['motor_force'] for i in range(num_drones)])
+forces = params[:, 2].copy()
 print(masses, forces)
 attc = AttittudeController(num_drones, masses, forces)
 posc = PositionController(num_drones)
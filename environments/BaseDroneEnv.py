@@ -1,12 +1,13 @@
 import numpy as np
 from gymnasium import utils
 from .mujoco_env_custom import extendedEnv
-from .env_gen import make_sim, mjcf_to_mjmodel
+from .env_gen import make_mjmodel, randomize_model_inplace, has_pendulum, DRONE_PARAM_NAMES
 from .joystick import PS4Controller
 from gymnasium.spaces import Box
 from ray.rllib.env.vector_env import VectorEnv
-from .transformation import mujoco_quat2DCM, mujoco_quat2rpy, mujoco_rpy2quat
-from .rewards import default_reward_fcn
+from .transformation import mujoco_quat2DCM, mujoco_quat2rpy_batch, mujoco_rpy2quat, mujoco_rpy2quat_batch
+from .rewards import default_reward_fcn, batch_reward_fcns
+from .kernels import fill_obs
 
 
 def default_termination_fcn(env, state, action, num_steps):
@@ -16,6 +17,16 @@ def default_termination_fcn(env, state, action, num_steps):
     return terminated
 
 
+def default_termination_fcn_batch(env, states, actions, num_steps):
+    """batched default_termination_fcn, returns a boolean array with an entry for every drone"""
+    pos_err = np.linalg.norm(states[:, :3] - np.asarray(env.reference[:3]), axis=1)
+    return (pos_err > env.max_distance) | (num_steps >= env.max_steps)
+
+
+# batched counterparts of the per drone termination functions
+batch_termination_fcns = {default_termination_fcn: default_termination_fcn_batch}
+
+
 base_config = {'seed': 42,
                'frequency': 100,  # physics simulator frequency
                'skip_steps': 1,  # policy takes action every skip_steps steps
@@ -43,6 +54,8 @@ base_config = {'seed': 42,
                'terminated_fcn': default_termination_fcn,
                'max_steps': 512,  # maximum length of a single episode
                'regen_env_at_steps': None,  # after this many (total) steps, regenerate drone model parameters
+               'stagger_resets': False,  # randomly shorten the first drone episodes so they do not end together
+               'regen_inplace': True,  # write regenerated drone parameters into the existing model instead of recompiling it
                'train_vis': 0,  # number of training environments to visualize
                'window_title': 'mujoco',
                'controlled': False,  # whether this instance of env has externally controller reference (for evaluation)
@@ -50,6 +63,15 @@ base_config = {'seed': 42,
 }
 
 
+def _axis_deadzone(value):
+    """applies the individual deadzone of a joystick axis while keeping the sign of the value"""
+    if value > 0.1:
+        return value - 0.1
+    if value < -0.1:
+        return value + 0.1
+    return 0.0
+
+
 class BaseDroneEnv(extendedEnv, VectorEnv, utils.EzPickle):
 
     def __init__(self, config, **kwargs):
@@ -93,10 +115,15 @@ class BaseDroneEnv(extendedEnv, VectorEnv, utils.EzPickle):
         self.random_start_pos = config.get('random_start_pos', False)
         self.random_params = config.get('random_params', False)
         self.regen_env_at_steps = config.get('regen_env_at_steps', None)
+        self.regen_inplace = config.get('regen_inplace', True)
+        self.stagger_resets = config.get('stagger_resets', False)
         self.start_pos = config.get('start_pos', self.reference)
         self.max_distance = config.get('max_distance', 1)
         self.reward_fcn = config.get('reward_fcn', default_reward_fcn)
         self.terminated_fcn = config.get('terminated_fcn', default_termination_fcn)
+        # batched versions evaluate all drones at once, fall back to per drone calls if there is none
+        self.reward_fcn_batch = config.get('reward_fcn_batch', batch_reward_fcns.get(self.reward_fcn))
+        self.terminated_fcn_batch = config.get('terminated_fcn_batch', batch_termination_fcns.get(self.terminated_fcn))
         self.max_steps = config.get('max_steps', 512)
         self.max_pos_offset = self.state_difficulty*config.get('max_random_offset', 0)
         self.angle_variance = self.state_difficulty*np.array(config.get('angle_variance', [0, 0]))
@@ -107,22 +134,44 @@ class BaseDroneEnv(extendedEnv, VectorEnv, utils.EzPickle):
 
         # setup
         self.total_steps = 0
-        self.num_steps = np.zeros((self.num_drones, ), dtype=np.long)
+        self.num_steps = np.zeros((self.num_drones, ), dtype=np.int64)
+        self._episode_limits = np.full((self.num_drones, ), self.max_steps, dtype=np.int64)  # per drone episode lengths
 
         # set random number generator seed for reproducibility
-        rng, seed = utils.seeding.np_random(seed=config.get('worker_index', -1) + 1 + config.get('seed', 1))
-        self.np_random = rng
-
-        # generate randomized parameters for each drone and save them into a list
-        self.drone_params = self.generate_drone_params()
-        self.num_params = len(self.drone_params[0])  # number of parameters per drone
+        seed = getattr(config, 'worker_index', -1) + 1 + config.get('seed', 1)
+        self._rng = np.random.Generator(np.random.PCG64(seed))
+        self.np_random = self._rng  # share the generator with the mujoco env base classes
+
+        # scales and clipping bounds of the gaussian noise used to sample random initial states, the first three
+        # entries are the unclipped direction of the position offset
+        noise_scales = [np.ones(3), self.angle_variance, self.vel_variance, self.ang_vel_variance]
+        if self.pendulum:
+            noise_scales += [self.pendulum_rp_variance, self.pendulum_ang_vel_variance]
+        self._state_noise_scale = np.concatenate(noise_scales)
+        self._state_noise_bound = 2 * self._state_noise_scale
+        self._state_noise_bound[:3] = np.inf
+
+        # generate randomized parameters for each drone and save them into a (num_drones, num_params) array
+        self.drone_params_array = self.generate_drone_params()
+        self.num_params = self.drone_params_array.shape[1]  # number of parameters per drone
         if self.pendulum:  # pendulum enabled
             self.num_states = 27
         else:
             self.num_states = 23
-        self.observation_space = Box(low=-np.inf, high=np.inf, shape=(self.num_states + self.num_params,), dtype=np.float64)
-        self.action_space = Box(low=0, high=1, shape=(4,), dtype=np.float64, seed=self.np_random)
-        model = mjcf_to_mjmodel(make_sim(self.drone_params, self.frequency, self.mocaps))  # create a mujoco model
+        # per drone sizes of the mujoco position and velocity vectors, fixed for the lifetime of the environment
+        self._nq = 7 + 2 * self.pendulum
+        self._nv = 6 + 2 * self.pendulum
+        # scratch rows for sampling single drone states
+        self._qpos_scratch = np.empty((1, self._nq), dtype=np.float64)
+        self._qvel_scratch = np.empty((1, self._nv), dtype=np.float64)
+        # preallocated buffers for the per drone states and for the motor controls
+        self._states_buf = np.empty((self.num_drones, self.num_states + self.num_params), dtype=np.float64)
+        self._ctrl_buf = np.empty(self.num_drones * 4, dtype=np.float64)
+        self._mocap_reference = None  # reference the mocap was last moved to
+        # observations and actions cross over to the torch policy as float32, the physics stay in float64
+        self.observation_space = Box(low=-np.inf, high=np.inf, shape=(self.num_states + self.num_params,), dtype=np.float32)
+        self.action_space = Box(low=0, high=1, shape=(4,), dtype=np.float32, seed=self._rng)
+        model = make_mjmodel(self.drone_params_array, self.frequency, self.mocaps)  # create a mujoco model
 
         self.metadata = {
             "render_modes": [
@@ -145,6 +194,7 @@ class BaseDroneEnv(extendedEnv, VectorEnv, utils.EzPickle):
 
         # init VectorEnv for rllib
         VectorEnv.__init__(self, self.observation_space, self.action_space, self.num_drones)
+        self._fill_states = self._make_state_filler()  # state gathering specialized for this drone setup
         self.states = self.get_drone_states()
         print('Environment ready')
 
@@ -156,20 +206,22 @@ class BaseDroneEnv(extendedEnv, VectorEnv, utils.EzPickle):
         z = -self.joystick.axis_data.get(3, 0)
         yaw = -self.joystick.axis_data.get(2, 0)
 
-        pert = np.array([x, y, z, yaw])  # perturbation to reference
-        xy_active = np.linalg.norm(pert[:2]) > 0.2  # joystick-vise deadzone
-        zyaw_active = np.linalg.norm(pert[2:]) > 0.2
-        mag = np.maximum(np.abs(pert) - 0.1, 0)  # individual value deadzones
-        sg = np.sign(pert)
-        pert = 0.1 * mag * sg * [xy_active, xy_active, zyaw_active, zyaw_active]
+        # perturbation to reference, plain scalar math is cheaper than numpy calls on four values
+        # work on a new array, the reference may be a tuple or a row of the caller's trajectory
+        ref = np.array(self.reference, dtype=np.float64)
+        xy_gain = 0.1 if (x*x + y*y)**0.5 > 0.2 else 0.0  # joystick-vise deadzone
+        zyaw_gain = 0.1 if (z*z + yaw*yaw)**0.5 > 0.2 else 0.0
+        ref[0] += xy_gain * _axis_deadzone(x)
+        ref[1] += xy_gain * _axis_deadzone(y)
+        ref[2] += zyaw_gain * _axis_deadzone(z)
+        ref[3] = (ref[3] + zyaw_gain * _axis_deadzone(yaw) + np.pi) % (2 * np.pi) - np.pi
 
         # apply clipping
-        self.reference = self.reference + pert
-        self.reference[3] = (self.reference[3] + np.pi) % (2 * np.pi) - np.pi
         center = np.array(self.start_pos[:3])
-        self.reference[:3] = np.clip(self.reference[:3], a_min=center + [-5, -5, -6], a_max=center + [5, 5, 6])  # update reference
-        quat = mujoco_rpy2quat([0, 0, self.reference[3]])  # get quaternion
-        self.move_mocap_to(np.concatenate((self.reference[:3], quat)), 0)
+        ref[:3] = np.clip(ref[:3], a_min=center + [-5, -5, -6], a_max=center + [5, 5, 6])
+        self.reference = ref  # update reference
+        quat = mujoco_rpy2quat([0, 0, ref[3]])  # get quaternion
+        self.move_mocap_to(np.concatenate((ref[:3], quat)), 0)
 
     def move_mocap_to(self, pose, idx=0):
         """update mocap using pose consisting of xyz coordinates and quaternion rotation"""
@@ -177,83 +229,68 @@ class BaseDroneEnv(extendedEnv, VectorEnv, utils.EzPickle):
         self.data.mocap_pos[idx] = pose[:3]  # update mocap coodrinates
         self.data.mocap_quat[idx] = pose[3:]
 
+    @property
+    def drone_params(self):
+        """list of per drone parameter dictionaries, built on demand from drone_params_array which should be preferred
+        on hot paths"""
+        return [dict(zip(DRONE_PARAM_NAMES, params)) for params in self.drone_params_array.tolist()]
+
     def generate_drone_params(self):
-        """sample drone model parameters using specified parameters if enabled"""
-        drone_params = []
+        """sample drone model parameters using specified parameters if enabled, returns a (num_drones, num_params)
+        array with columns ordered as DRONE_PARAM_NAMES"""
         # load parameter intervals
-        c_m, w_m = self.mass_interval
-        c_al, w_al = self.arm_len_interval
-        c_mf, w_mf = self.motor_force_interval
-        c_mt, w_mt = self.motor_tau_interval
-        c_pl, w_pl = self.pendulum_length_interval
-        c_wm, w_wm = self.weight_mass_interval
+        intervals = np.array([self.mass_interval, self.arm_len_interval, self.motor_force_interval,
+                              self.motor_tau_interval, self.pendulum_length_interval, self.weight_mass_interval])
+        centers, widths = intervals.T
         if self.random_params:
             # generate random values uniformly from the intervals
-            masses = c_m + self.np_random.uniform(-w_m, w_m, self.num_drones)*self.param_difficulty
-            arm_lens = c_al + self.np_random.uniform(-w_al, w_al, self.num_drones)*self.param_difficulty
-            motor_forces = c_mf + self.np_random.uniform(-w_mf, w_mf, self.num_drones)*self.param_difficulty
-            motor_taus = c_mt + self.np_random.uniform(-w_mt, w_mt, self.num_drones)*self.param_difficulty
-            pendulum_lens = c_pl + self.np_random.uniform(-w_pl, w_pl, self.num_drones)*self.param_difficulty
-            weight_masses = c_wm + self.np_random.uniform(-w_wm, w_wm, self.num_drones)*self.param_difficulty
+            noise = self._rng.uniform(-1, 1, size=(self.num_drones, len(DRONE_PARAM_NAMES)))
+            drone_params = centers + noise * widths * self.param_difficulty
         else:
             # use mean values of the intervals instead
-            masses = c_m*np.ones(self.num_drones)
-            arm_lens = c_al*np.ones(self.num_drones)
-            motor_forces = c_mf*np.ones(self.num_drones)
-            motor_taus = c_mt*np.ones(self.num_drones)
-            pendulum_lens = c_pl*np.ones(self.num_drones)
-            weight_masses = c_wm*np.ones(self.num_drones)
-        # save parameters into a list of dictionaries
-        for i in range(self.num_drones):
-            params = {'mass': masses[i],
-                      'arm_len': arm_lens[i],
-                      'motor_force': motor_forces[i],
-                      'motor_tau': motor_taus[i],
-                      'pendulum_len': self.pendulum*pendulum_lens[i],
-                      'weight_mass': self.pendulum*weight_masses[i],
-                      }
-            drone_params.append(params)
+            drone_params = np.tile(centers, (self.num_drones, 1))
+        drone_params[:, 4:] *= self.pendulum  # pendulum length and weight mass are zero without pendulum
         return drone_params
 
     def sample_state(self):
-        """returns a drone state sampled randomly from specified parameters if enabled"""
+        """returns a drone state sampled randomly from specified parameters if enabled, the returned arrays are views
+        of scratch buffers that are overwritten by the next call"""
+        qpos, qvel = self.sample_states_batch(1, self._qpos_scratch, self._qvel_scratch)
+        return qpos[0], qvel[0]
+
+    def sample_states_batch(self, num, qpos=None, qvel=None):
+        """returns states of num drones sampled randomly from specified parameters if enabled, as (num, nq) and
+        (num, nv) arrays of per drone mujoco positions and velocities. The states are written into the qpos and qvel
+        arrays if they are given"""
+        if qpos is None:
+            qpos = np.empty((num, self._nq))
+        if qvel is None:
+            qvel = np.empty((num, self._nv))
         if self.random_start_pos:  # initial poses generated randomly
-            # sample random point inside sphere uniformly
-            direction = self.np_random.normal(size=3)
-            direction /= np.linalg.norm(direction)
-            r = self.max_pos_offset * np.cbrt(self.np_random.random())
-            pos = self.start_pos[:3] + r * direction
-            # sample rp angles from a clipped gaussian
-            rp = self.np_random.normal(scale=self.angle_variance, size=2)\
-                      .clip(min=-2 * self.angle_variance, max=2 * self.angle_variance)
-            # sample yaw angle uniformly
-            y = np.pi - 2 * np.pi * self.np_random.random()  # uniform yaw angle
-            rpy = np.append(rp, y)
-            qpos = np.concatenate((pos, mujoco_rpy2quat(rpy)))  # convert to mujoco format of qpos
-            # sample velocity and angular velocity vectors from clipped normal distributions
-            vel = self.np_random.normal(scale=self.vel_variance).clip(min=-2 * self.vel_variance, max=2 * self.vel_variance)
-            ang_vel = self.np_random.normal(scale=self.ang_vel_variance).clip(min=-2 * self.ang_vel_variance, max=2 * self.ang_vel_variance)
-            qvel = np.concatenate((vel, ang_vel))
-            if self.pendulum:  # if pendulum is enabled, generate its state as well
-                # sample roll and pitch from clipped gaussian
-                pendulum_rp = self.np_random.normal(scale=self.pendulum_rp_variance)\
-                    .clip(min=-2 * self.pendulum_rp_variance, max=2 * self.pendulum_rp_variance)
-                pendulum_vel = self.np_random.normal(scale=self.pendulum_ang_vel_variance)\
-                    .clip(min=-2 * self.pendulum_ang_vel_variance, max=2 * self.pendulum_ang_vel_variance)
-                qpos = np.concatenate((qpos, pendulum_rp))
-                qvel = np.concatenate((qvel, pendulum_vel))
+            # draw all the gaussian and uniform samples at once
+            noise = np.clip(self._rng.normal(size=(num, len(self._state_noise_scale))) * self._state_noise_scale,
+                            -self._state_noise_bound, self._state_noise_bound)
+            uniform = self._rng.random((num, 2))
+            # sample random points inside sphere uniformly
+            direction = noise[:, :3] / np.linalg.norm(noise[:, :3], axis=1, keepdims=True)
+            r = self.max_pos_offset * np.cbrt(uniform[:, 0])
+            qpos[:, :3] = np.asarray(self.start_pos[:3]) + r[:, None] * direction
+            # rp angles from a clipped gaussian and uniform yaw angle, converted to mujoco quaternions
+            rpy = np.empty((num, 3))
+            rpy[:, :2] = noise[:, 3:5]
+            rpy[:, 2] = np.pi - 2 * np.pi * uniform[:, 1]
+            qpos[:, 3:7] = mujoco_rpy2quat_batch(rpy)
+            # velocity and angular velocity vectors from clipped normal distributions
+            qvel[:, :6] = noise[:, 5:11]
+            if self.pendulum:  # if pendulum is enabled, add its roll, pitch and angular velocity as well
+                qpos[:, 7:9] = noise[:, 11:13]
+                qvel[:, 6:8] = noise[:, 13:15]
         else:
-            # deterministic inital pose
-            pos = self.start_pos[:3]
-            rpy = np.append([0, 0], self.start_pos[3])
-            qpos = np.concatenate((pos, mujoco_rpy2quat(rpy)))
-            # deterministic initial velocity
-            vel = [0, 0, 0]
-            ang_vel = [0, 0, 0]
-            qvel = np.concatenate((vel, ang_vel))
-            if self.pendulum:
-                qpos = np.concatenate((qpos, [0, 0]))
-                qvel = np.concatenate((qvel, [0, 0]))
+            # deterministic inital pose and zero velocities
+            qpos[:, :3] = self.start_pos[:3]
+            qpos[:, 3:7] = mujoco_rpy2quat([0, 0, self.start_pos[3]])
+            qpos[:, 7:] = 0
+            qvel[:] = 0
         return qpos, qvel
 
     def vector_step(self, actions):
@@ -262,66 +299,96 @@ class BaseDroneEnv(extendedEnv, VectorEnv, utils.EzPickle):
 
         if self.controlled:  # update reference visualization using controller if enabled
             self.control_reference()
-        else:  # otherwise, just set the reference vis to default reference
-            pose = np.concatenate((self.reference[:3], mujoco_rpy2quat([0, 0, self.reference[3]])))
+        elif self._mocap_reference is None or not np.array_equal(self._mocap_reference, self.reference):
+            # otherwise, just set the reference vis to default reference whenever it changes
+            self._mocap_reference = np.array(self.reference, dtype=np.float64)
+            pose = np.concatenate((self._mocap_reference[:3], mujoco_rpy2quat([0, 0, self._mocap_reference[3]])))
             self.move_mocap_to(pose, 0)
 
-        ctrl = 0.1 + 0.9*np.array(actions).ravel()  # reformat actions for mujoco and constrain to [0.1, 1]
+        # reformat actions for mujoco and constrain to [0.1, 1]
+        ctrl = self._ctrl_buf
+        if isinstance(actions, np.ndarray):
+            np.multiply(actions.reshape(-1), 0.9, out=ctrl)
+        else:
+            np.copyto(ctrl, np.ravel(actions))
+            ctrl *= 0.9
+        ctrl += 0.1
         self.do_simulation(ctrl, self.frame_skip)
-        self.num_steps = self.num_steps + 1  # keep count of episode lengths
+        self.num_steps += 1  # keep count of episode lengths
         self.total_steps += 1  # keep count of total simulation steps performed
         self.states = self.get_drone_states()  # update states after simulation step
 
-        rewards, dones, truncated, infos = [], [], [], []
-        for i in range(self.num_drones):
-            state_i = self.states[i]  # load state
-            truncate = self.terminated_fcn(self, state_i, actions[i], self.num_steps[i])  # decide episode termination
-            reward = self.reward_fcn(self, state_i, actions[i], self.num_steps[i])  # compute reward
-            # add all values to the output lists
-            rewards.append(reward)
-            dones.append(False)
-            truncated.append(truncate)
-            infos.append({})
+        actions_array = np.asarray(actions)
+        if self.terminated_fcn_batch is not None:  # decide episode termination
+            truncated = self.terminated_fcn_batch(self, self.states, actions_array, self.num_steps)
+        else:
+            truncated = np.array([self.terminated_fcn(self, self.states[i], actions[i], self.num_steps[i]) for i in range(self.num_drones)])
+        # staggered episodes end at their own per drone limits before max_steps
+        truncated = (truncated | (self.num_steps >= self._episode_limits)).tolist()
+        if self.reward_fcn_batch is not None:  # compute rewards
+            rewards = self.reward_fcn_batch(self, self.states, actions_array, self.num_steps).tolist()
+        else:
+            rewards = [self.reward_fcn(self, self.states[i], actions[i], self.num_steps[i]) for i in range(self.num_drones)]
+        dones = [False]*self.num_drones
+        infos = [{}]*self.num_drones
 
         if self.render_mode == 'human':  # if rendering is enabled, render after each simulation step
             self.render()
 
         if self.random_params and self.regen_env_at_steps and self.total_steps == self.regen_env_at_steps:
             self.total_steps = 0
-            self.reset_model(regen=True)  # reset model with regenerated drone parameters
-            truncated = np.ones(self.num_drones, dtype=bool)  # set all drones to terminated
+            # regenerate drone parameters, the drones keep their states so their episodes continue
+            self.regenerate_drones(inplace=self.regen_inplace)
+            self.states = self.get_drone_states()  # update states with the new parameters
 
         return self._get_obs(), rewards, dones, truncated, infos
 
-    def reset_model(self, regen=False):
-        """regenerates all the drone states and also their model parameters if enabled """
-        if regen:  # regenerate parameters of the drones and restart the simulation
-            self.drone_params = self.generate_drone_params()
-            model = mjcf_to_mjmodel(make_sim(self.drone_params, self.frequency, self.mocaps))  # create a mujoco model
-            self.close()
-            extendedEnv.__init__(
-                self,
-                model,
-                frame_skip=self.skip_steps,
-                render_mode=self.render_mode,
-                observation_space=self.observation_space,
-                width=self.width,
-                height=self.height
-            )
+    def regenerate_drones(self, inplace=True):
+        """regenerates the drone model parameters while keeping the current simulation state of the drones. With
+        inplace, the parameters are written directly into the current model and the viewer is kept, the model is
+        only recompiled if a drone gains or loses its pendulum"""
+        drone_params = self.generate_drone_params()
+        if inplace and np.array_equal(has_pendulum(drone_params), has_pendulum(self.drone_params_array)):
+            self.drone_params_array = drone_params
+            randomize_model_inplace(self.model, self.drone_params_array)
+            return
+
+        qpos, qvel, act = self.data.qpos.copy(), self.data.qvel.copy(), self.data.act.copy()  # save simulation state
+        self.drone_params_array = drone_params
+        model = make_mjmodel(self.drone_params_array, self.frequency, self.mocaps)  # create a mujoco model
+        self.close()
+        extendedEnv.__init__(
+            self,
+            model,
+            frame_skip=self.skip_steps,
+            render_mode=self.render_mode,
+            observation_space=self.observation_space,
+            width=self.width,
+            height=self.height
+        )
+        self.data.act[:] = act  # restore the simulation state in the new model
+        self._mocap_reference = None  # new simulation data, the mocap needs to be moved again
+        self.set_state(qpos, qvel)
+
+    def reset_model(self, regen=False, regen_inplace=None):
+        """regenerates all the drone states and also their model parameters if enabled, regen_inplace overrides the
+        regen_inplace config option """
+        if regen:  # regenerate parameters of the drones
+            self.regenerate_drones(inplace=self.regen_inplace if regen_inplace is None else regen_inplace)
 
         qpos = self.init_qpos  # copy mujoco state vector
         qvel = self.init_qvel
-        assert len(qpos) == self.num_drones*(7 + 2*self.pendulum)
-        assert len(qvel) == self.num_drones*(6 + 2*self.pendulum)
-        p_offset = 2 * self.pendulum  # if there is pendulum, add extra offset to indeces
-        v_offset = 2 * self.pendulum
-        for i in range(self.num_drones):  # generate initial poses and populate the mujoco state array
-            qpos_i, qvel_i = self.sample_state()
-            qpos[(7 + p_offset) * i:(7 + p_offset) * (i + 1)] = qpos_i
-            qvel[(6 + v_offset) * i:(6 + v_offset) * (i + 1)] = qvel_i
-
-        self.num_steps = np.zeros((self.num_drones, ), dtype=np.long)  # reset per drone number of steps
+        # generate initial poses of all the drones directly into the per drone rows of the mujoco state arrays
+        self.sample_states_batch(self.num_drones, qpos.reshape(self.num_drones, self._nq),
+                                 qvel.reshape(self.num_drones, self._nv))
+
+        self.num_steps[:] = 0  # reset per drone number of steps
+        if self.stagger_resets:  # shorten the first episodes randomly so that the drones do not truncate all at once
+            self._episode_limits[:] = self.max_steps - self._rng.integers(0, self.max_steps, size=self.num_drones)
+        else:
+            self._episode_limits[:] = self.max_steps
         self.set_state(qpos, qvel)  # set the mujoco state
+        self._mocap_reference = None  # resetting the simulation data moves the mocap back to its default pose
         self.states = self.get_drone_states()  # update states after simulation step
         return self._get_obs()
 
@@ -337,48 +404,74 @@ class BaseDroneEnv(extendedEnv, VectorEnv, utils.EzPickle):
             index = 0
         assert index < self.num_drones
 
-        p_offset = 2 * self.pendulum  # add extra offset if there is pendulum state enabled
-        v_offset = 2 * self.pendulum
-        qpos = self.data.qpos[:]  # copy mujoco state
-        qvel = self.data.qvel[:]
-        qpos_i, qvel_i = self.sample_state()  # generate an initial state
-        qpos[(7 + p_offset) * index:(7 + p_offset) * (index + 1)] = qpos_i
-        qvel[(6 + v_offset) * index:(6 + v_offset) * (index + 1)] = qvel_i
-        self.set_state(qpos, qvel)  # update the mujoco state
+        qpos, qvel = self.sample_state()  # generate an initial state
+        self.data.qpos.reshape(self.num_drones, self._nq)[index] = qpos  # write it into the drone's row
+        self.data.qvel.reshape(self.num_drones, self._nv)[index] = qvel
+        self.set_state(self.data.qpos, self.data.qvel)  # update the mujoco state
         self.num_steps[index] = 0  # reset the per drone step count
+        self._episode_limits[index] = self.max_steps  # only the first episodes after a full reset are staggered
         info = {}
         ob = self._get_obs()[index]
         return ob, info
 
     def _get_obs(self):
-        """defaults observation function consists of just the states"""
-        return self.states
+        """defaults observation function consists of just the states, converted to float32 for the policy. This also
+        copies the state buffer, which rllib needs as it keeps references to the returned observations"""
+        return self.states.astype(np.float32)
 
     def get_drone_states(self):
         """Returns an array of per drone states. Each state consists of the position, rpy angles, velocity,
         angular velocity vector, the acceleration vector, reference vector and the drone model parameters.
-        The vectors are represented in the global coordinate frame.
+        The vectors are represented in the global coordinate frame. The returned array is the preallocated state
+        buffer, which is overwritten by the next call.
         """
-        states = []  # state info for every drone
-        pos_idx_offset = 2 * self.pendulum  # add an index offset if pendulum is enabled
-        vel_idx_offset = 2 * self.pendulum
-        for i in range(self.num_drones):
-            # all these observations correspond to the free joint coordinates and thus are in global coord. frame
-            pos = self.data.qpos[(7 + pos_idx_offset)*i:(7 + pos_idx_offset)*i + 3]  # xyz position
-            rpy = mujoco_quat2rpy(self.data.qpos[(7 + pos_idx_offset)*i + 3:(7 + pos_idx_offset)*i + 7])  # rpy angles
-            vel = self.data.qvel[(6 + vel_idx_offset)*i:(6 + vel_idx_offset)*i + 3]  # xyz velocity
-            ang_vel = self.data.qvel[(6 + vel_idx_offset)*i + 3:(6 + vel_idx_offset)*i + 6]  # rpy velocity (probably in different order)
-            acc = self.data.sensordata[i*3:i*3+3]  # accelerometer data (given there is only one sensor on each drone)
-            act = self.data.act[i*4:(i+1)*4]
-            if self.pendulum:
-                pendulum_rp = self.data.qpos[(7 + pos_idx_offset)*i + 7:(7 + pos_idx_offset)*(i + 1)]
-                pendulum_ang_vel = self.data.qvel[(6 + vel_idx_offset)*i + 6:(6 + vel_idx_offset)*(i + 1)]
-                obs = np.concatenate((pos, rpy, vel, ang_vel, pendulum_rp, pendulum_ang_vel, acc, act, self.reference, list(self.drone_params[i].values())))
-            else:
-                obs = np.concatenate((pos, rpy, vel, ang_vel, acc, act, self.reference, list(self.drone_params[i].values())))
-            states.append(obs)  # add state to state list
+        states = self._states_buf
+        self._fill_states(states)
         return states
 
+    def _make_state_filler(self):
+        """returns a function writing the per drone states into a given buffer, specialized for the number of drones
+        and the pendulum setting, which do not change after construction, so that the per step path has no branches
+        and all the strides and column slices are constants"""
+        n, nq, nv = self.num_drones, self._nq, self._nv
+        pendulum = bool(self.pendulum)
+        idx = 16 if pendulum else 12
+        acc, act, ref, params = (slice(idx, idx + 3), slice(idx + 3, idx + 7), slice(idx + 7, idx + 11),
+                                 slice(idx + 11, None))
+
+        if fill_obs is not None:  # fused jit kernel if numba is available
+            def fill(states):
+                data = self.data  # looked up on every call, the simulation data is replaced when the model is rebuilt
+                fill_obs(data.qpos, data.qvel, data.sensordata, data.act, np.asarray(self.reference, dtype=np.float64),
+                         self.drone_params_array, pendulum, states)
+            return fill
+
+        def fill_common(states, data, qpos, qvel):
+            # all these observations correspond to the free joint coordinates and thus are in global coord. frame
+            states[:, 0:3] = qpos[:, 0:3]  # xyz position
+            states[:, 3:6] = mujoco_quat2rpy_batch(qpos[:, 3:7])  # rpy angles
+            states[:, 6:9] = qvel[:, 0:3]  # xyz velocity
+            states[:, 9:12] = qvel[:, 3:6]  # rpy velocity (probably in different order)
+            states[:, acc] = data.sensordata[:3 * n].reshape(n, 3)  # accelerometer data (one sensor per drone)
+            states[:, act] = data.act[:4 * n].reshape(n, 4)
+            states[:, ref] = self.reference
+            states[:, params] = self.drone_params_array
+
+        if pendulum:
+            def fill(states):
+                data = self.data
+                # view the mujoco state arrays as one row per drone (no copy, mjData arrays are contiguous)
+                qpos = data.qpos.reshape(n, nq)
+                qvel = data.qvel.reshape(n, nv)
+                fill_common(states, data, qpos, qvel)
+                states[:, 12:14] = qpos[:, 7:9]  # pendulum rp angles
+                states[:, 14:16] = qvel[:, 6:8]  # pendulum angular velocity
+        else:
+            def fill(states):
+                data = self.data
+                fill_common(states, data, data.qpos.reshape(n, nq), data.qvel.reshape(n, nv))
+        return fill
+
     def viewer_setup(self):
         assert self.viewer is not None
         v = self.viewer
@@ -2,6 +2,11 @@ import numpy as np
 from matplotlib.colors import hsv_to_rgb
 from dm_control import mjcf
 from dm_control import mujoco
+from mujoco import MjData, mjtGeom, mj_setConst, mju_quat2Mat
+
+# order of the drone parameters in the parameter arrays and observations
+DRONE_PARAM_NAMES = ('mass', 'arm_len', 'motor_force', 'motor_tau', 'pendulum_len', 'weight_mass')
+HALF_BODY_SIZE = 0.05  # half size of the drone core box
 
 
 def make_drone(id=0, hue=1, params=None):
@@ -35,7 +40,7 @@ def make_drone(id=0, hue=1, params=None):
         pendulum = True
     pole_mass = 0.2*pendulum_length
 
-    half_body_size = 0.05
+    half_body_size = HALF_BODY_SIZE
 
     # hopefully, this is a reasonable mass distribution
     body_mass = 0.56*mass
@@ -115,7 +120,7 @@ def make_sim(drone_params=[None], frequency=1000, mocaps=1):
     drones = [make_drone(i, i/num_drones, drone_params[i]) for i in range(num_drones)]
     height = .15
     margin = 0.5
-    sz = np.ceil(np.sqrt(num_drones)).astype(np.long)
+    sz = np.ceil(np.sqrt(num_drones)).astype(np.int64)
     steps = (np.arange(sz) - (sz-1)/2) * margin
     xpos, ypos, zpos = np.meshgrid(steps, steps, [height])
     for i, model in enumerate(drones):
@@ -131,3 +136,138 @@ def mjcf_to_mjmodel(mjcf_model):
     # assets = arena.get_assets()
     model = mujoco.MjModel.from_xml_string(xml_string)
     return model
+
+
+def make_mjmodel(drone_params_array, frequency=1000, mocaps=1):
+    """returns a compiled mujoco model for a (num_drones, num_params) array of drone parameters"""
+    drone_params = [dict(zip(DRONE_PARAM_NAMES, params)) for params in np.asarray(drone_params_array).tolist()]
+    return mjcf_to_mjmodel(make_sim(drone_params, frequency, mocaps))
+
+
+def has_pendulum(drone_params_array):
+    """returns a boolean array telling which drones are generated with a pendulum"""
+    return (drone_params_array[:, 4] > 0) & (drone_params_array[:, 5] > 0)
+
+
+def _core_inertia(mass, arm_len):
+    """principal inertia and center of mass height of the drone core body, mirrors the geoms in make_drone"""
+    hb = HALF_BODY_SIZE
+    body_mass, arm_mass, motor_mass = 0.56*mass, 0.07*mass, 0.04*mass
+    arm_dist = np.sqrt(2)*hb + 0.5*arm_len  # distance of arm and motor centers from the body center
+    rot_dist = np.sqrt(2)*hb + arm_len
+    # core box
+    ixx = body_mass/3*(hb**2 + (hb/3)**2)
+    izz = body_mass/3*(2*hb**2)
+    # four arm boxes rotated by +-45 and +-135 degrees, their off diagonal terms cancel out
+    arm_x, arm_y = arm_len/2, arm_len/20
+    ixx += 4*(arm_mass/3*(arm_x**2 + 3*arm_y**2)/2 + arm_mass*arm_dist**2/2)
+    izz += 4*(arm_mass/3*(arm_x**2 + arm_y**2) + arm_mass*arm_dist**2)
+    # four motor cylinders with radius and half height 0.01, lifted by 0.015
+    ixx += 4*(motor_mass*(3*0.01**2 + 4*0.01**2)/12 + motor_mass*(rot_dist**2/2 + 0.015**2))
+    izz += 4*(motor_mass*0.01**2/2 + motor_mass*rot_dist**2)
+    com_z = 4*motor_mass*0.015/mass
+    ixx -= mass*com_z**2  # move to the center of mass
+    return np.array([ixx, ixx, izz]), com_z
+
+
+def _pendulum_inertia(pendulum_len, weight_mass):
+    """principal inertia and center of mass height of the pendulum body, mirrors the geoms in make_drone"""
+    pole_mass = 0.2*pendulum_len
+    weight_size = 0.1*np.cbrt(weight_mass)
+    mass = pole_mass + weight_mass
+    com_z = -(pole_mass*pendulum_len/2 + weight_mass*pendulum_len)/mass
+    ixx = pole_mass*(3*0.005**2 + pendulum_len**2)/12 + pole_mass*(-pendulum_len/2 - com_z)**2
+    ixx += weight_mass/3*2*weight_size**2 + weight_mass*(-pendulum_len - com_z)**2
+    izz = pole_mass*0.005**2/2 + weight_mass/3*2*weight_size**2
+    return np.array([ixx, ixx, izz]), com_z, mass
+
+
+def _set_geom(model, geom_id, size=None, pos=None):
+    """updates the size and position of a box or cylinder geom together with its bounding sphere and box"""
+    if size is not None:
+        model.geom_size[geom_id, :len(size)] = size
+        if model.geom_type[geom_id] == mjtGeom.mjGEOM_BOX:
+            model.geom_rbound[geom_id] = np.linalg.norm(size)
+            half_sizes = size
+        else:  # cylinder
+            model.geom_rbound[geom_id] = np.sqrt(size[0]**2 + size[1]**2)
+            half_sizes = [size[0], size[0], size[1]]
+        if hasattr(model, 'geom_aabb'):  # center and half sizes of the bounding box in the geom frame
+            model.geom_aabb[geom_id, :3] = 0
+            model.geom_aabb[geom_id, 3:] = half_sizes
+    if pos is not None:
+        model.geom_pos[geom_id] = pos
+
+
+def _quat2mat(quat):
+    mat = np.empty(9)
+    mju_quat2Mat(mat, np.asarray(quat, dtype=np.float64))
+    return mat.reshape(3, 3)
+
+
+def _update_body_bvh(model, body_id):
+    """recomputes the bounding boxes of the bounding volume hierarchy of a body from the bounding boxes of its geoms,
+    the boxes are axis aligned in the inertial frame of the body. The tree structure is kept as compiled"""
+    if not hasattr(model, 'bvh_aabb') or model.body_bvhnum[body_id] == 0:
+        return
+    adr = model.body_bvhadr[body_id]
+    inertial_rot = _quat2mat(model.body_iquat[body_id])
+
+    def bounds(node):
+        geom_id = model.bvh_nodeid[adr + node]
+        if geom_id >= 0:  # leaf, bounding box of the geom rotated into the inertial frame
+            rot = inertial_rot.T @ _quat2mat(model.geom_quat[geom_id])
+            center = inertial_rot.T @ (model.geom_pos[geom_id] - model.body_ipos[body_id]) + rot @ model.geom_aabb[geom_id, :3]
+            half_sizes = np.abs(rot) @ model.geom_aabb[geom_id, 3:]
+            low, high = center - half_sizes, center + half_sizes
+        else:  # inner node, union of the bounding boxes of its children
+            (low_a, high_a), (low_b, high_b) = [bounds(child) for child in model.bvh_child[adr + node]]
+            low, high = np.minimum(low_a, low_b), np.maximum(high_a, high_b)
+        model.bvh_aabb[adr + node, :3] = (low + high) / 2
+        model.bvh_aabb[adr + node, 3:] = (high - low) / 2
+        return low, high
+
+    bounds(0)
+
+
+def randomize_model_inplace(model, drone_params_array):
+    """writes new drone parameters straight into a compiled model created by make_sim, this updates the masses,
+    inertias, geometry, bounding volumes and motor properties without recompiling. The presence of the pendulum on
+    each drone must stay the same as in the compiled model. The hand derived values mirror make_drone, compare them
+    with a compiled model by running inplace_regen_test.py after changing make_drone"""
+    for i, (mass, arm_len, motor_force, motor_tau, pendulum_len, weight_mass) in enumerate(drone_params_array):
+        prefix = 'drone_%d/' % i
+        core_id = model.body(prefix + 'core_body_%d' % i).id
+        model.body_mass[core_id] = mass
+        model.body_inertia[core_id], com_z = _core_inertia(mass, arm_len)
+        model.body_ipos[core_id] = [0, 0, com_z]
+        model.body_iquat[core_id] = [1, 0, 0, 0]
+        for j in range(4):
+            theta = j * np.pi / 2 - np.pi/4
+            direction = np.array([np.cos(theta), np.sin(theta), 0])
+            arm_pos = (np.sqrt(2)*HALF_BODY_SIZE + 0.5*arm_len) * direction
+            rot_pos = (np.sqrt(2)*HALF_BODY_SIZE + arm_len) * direction
+            _set_geom(model, model.geom(prefix + 'arm_%d' % j).id, size=[arm_len/2, arm_len/20, arm_len/20], pos=arm_pos)
+            _set_geom(model, model.geom(prefix + 'motor_%d' % j).id, pos=rot_pos + [0, 0, 0.015])
+            _set_geom(model, model.geom(prefix + 'prop_%d' % j).id, size=[arm_len/1.5, 0.0025], pos=rot_pos + [0, 0, 0.025])
+            site_id = model.site(prefix + 'motorsite_%d' % j).id
+            model.site_pos[site_id] = rot_pos
+            model.site_size[site_id, 1] = arm_len/20
+            motor_id = model.actuator(prefix + 'motor_%d' % j).id
+            model.actuator_gear[motor_id, 2] = motor_force
+            model.actuator_gear[motor_id, 5] = motor_force/100*(-1)**j
+            model.actuator_dynprm[motor_id, 0] = motor_tau
+        if pendulum_len > 0 and weight_mass > 0:
+            pend_id = model.body(prefix + 'pendulum').id
+            inertia, com_z, pend_mass = _pendulum_inertia(pendulum_len, weight_mass)
+            model.body_mass[pend_id] = pend_mass
+            model.body_inertia[pend_id] = inertia
+            model.body_ipos[pend_id] = [0, 0, com_z]
+            model.body_iquat[pend_id] = [1, 0, 0, 0]
+            pole_id, weight_id = model.body_geomadr[pend_id], model.body_geomadr[pend_id] + 1
+            _set_geom(model, pole_id, size=[0.005, pendulum_len/2], pos=[0, 0, -pendulum_len/2])
+            weight_size = 0.1*np.cbrt(weight_mass)
+            _set_geom(model, weight_id, size=[weight_size]*3, pos=[0, 0, -pendulum_len])
+            _update_body_bvh(model, pend_id)
+        _update_body_bvh(model, core_id)
+    mj_setConst(model, MjData(model))  # recompute the constants derived from the body masses, uses scratch data
@@ -0,0 +1,49 @@
+import math
+import numpy as np
+
+try:
+    from numba import njit, prange
+except ImportError as e:
+    NUMBA_IMPORT_ERROR = e
+else:
+    NUMBA_IMPORT_ERROR = None
+
+
+if NUMBA_IMPORT_ERROR is None:
+    @njit(cache=True, fastmath=True, parallel=True)
+    def fill_obs(qpos, qvel, sens, act, ref, params, pendulum, out):
+        """writes the per drone states into the rows of out in a single pass over the mujoco state arrays,
+        the column layout matches BaseDroneEnv.get_drone_states"""
+        nq = 9 if pendulum else 7  # mujoco state vector lengths per drone
+        nv = 8 if pendulum else 6
+        num_params = params.shape[1]
+        for i in prange(out.shape[0]):
+            qp = nq * i
+            qv = nv * i
+            for j in range(3):  # xyz position
+                out[i, j] = qpos[qp + j]
+            # rpy angles from the (normalized) free joint quaternion
+            w, x, y, z = qpos[qp + 3], qpos[qp + 4], qpos[qp + 5], qpos[qp + 6]
+            norm = math.sqrt(w * w + x * x + y * y + z * z)
+            w, x, y, z = w / norm, x / norm, y / norm, z / norm
+            out[i, 3] = math.atan2(2 * (w * x + y * z), 1 - 2 * (x * x + y * y))
+            out[i, 4] = math.asin(min(max(2 * (w * y - z * x), -1.0), 1.0))
+            out[i, 5] = math.atan2(2 * (w * z + x * y), 1 - 2 * (y * y + z * z))
+            for j in range(6):  # velocity and angular velocity
+                out[i, 6 + j] = qvel[qv + j]
+            k = 12
+            if pendulum:
+                out[i, 12] = qpos[qp + 7]
+                out[i, 13] = qpos[qp + 8]
+                out[i, 14] = qvel[qv + 6]
+                out[i, 15] = qvel[qv + 7]
+                k = 16
+            for j in range(3):  # accelerometer data
+                out[i, k + j] = sens[3 * i + j]
+            for j in range(4):  # motor activations and reference
+                out[i, k + 3 + j] = act[4 * i + j]
+                out[i, k + 7 + j] = ref[j]
+            for j in range(num_params):
+                out[i, k + 11 + j] = params[i, j]
+else:
+    fill_obs = None
@@ -195,9 +195,8 @@ class extendedEnv(MujocoEnv):
         self.data = mujoco.MjData(self.model)
 
     def do_simulation(self, ctrl, n_frames):
-        bounds = self.model.actuator_ctrlrange.copy().astype(np.float32)
-        low, high = bounds.T
-        if np.array(ctrl).shape != low.shape:
+        # frames are stepped inside mujoco with a single mj_step(nstep=frame_skip) call
+        if np.shape(ctrl) != (self.model.nu,):
             raise ValueError("Action dimension mismatch")
         self._step_mujoco_simulation(ctrl, n_frames)
 
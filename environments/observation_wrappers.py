@@ -1,7 +1,18 @@
 from .BaseDroneEnv import BaseDroneEnv
 from gymnasium.spaces import Box
 import numpy as np
-from .transformation import mujoco_quat2DCM, mujoco_rpy2quat
+from .transformation import mujoco_quat2DCM, mujoco_rpy2quat, mujoco_rpy2DCM_batch
+
+
+def _local_frame_states(states, reference):
+    """returns the reference position errors and velocities of all the drones rotated into their local frames and their
+    signed yaw differences with respect to the reference, computed for all the drones at once"""
+    ref = np.asarray(reference, dtype=np.float64)
+    R = mujoco_rpy2DCM_batch(states[:, 3:6])  # local to global frame rotation of each drone
+    loc_ref_err = np.einsum('nji,nj->ni', R, ref[:3] - states[:, :3])  # reference direction in local frame
+    loc_vel = np.einsum('nji,nj->ni', R, states[:, 6:9])  # velocity in local frame
+    heading_diff = (ref[3] - states[:, 5] + np.pi) % (2 * np.pi) - np.pi  # yaw signed difference
+    return loc_ref_err, heading_diff, loc_vel
 
 
 class GlobalFrameRPYEnv(BaseDroneEnv):
@@ -11,10 +22,10 @@ class GlobalFrameRPYEnv(BaseDroneEnv):
         self.num_states = 16
         self.num_params = 0
         num_obs = self.num_states + self.num_params
-        self.observation_space = Box(low=-np.inf, high=np.inf, shape=(num_obs,), dtype=np.float64)
+        self.observation_space = Box(low=-np.inf, high=np.inf, shape=(num_obs,), dtype=np.float32)
 
     def _get_obs(self):
-        drone_states = super()._get_obs()
+        drone_states = self.states
         out_obs = []
         for state in drone_states:
             xyz = state[:3]
@@ -32,7 +43,7 @@ class GlobalFrameRPYEnv(BaseDroneEnv):
             glob_ref_err = np.array(self.reference[:3] - xyz)
             obs_i = np.concatenate([glob_ref_err, rpy[:2], heading_diff, vel, ang_vel, pendulum_rp, pendulum_ang_vel])
             out_obs.append(obs_i)
-        return out_obs
+        return np.array(out_obs, dtype=np.float32)
 
 
 class LocalFramePRYEnv(BaseDroneEnv):
@@ -45,10 +56,10 @@ class LocalFramePRYEnv(BaseDroneEnv):
         self.num_states = 16
         self.num_params = 0
         num_obs = self.num_states + self.num_params
-        self.observation_space = Box(low=-np.inf, high=np.inf, shape=(num_obs,), dtype=np.float64)
+        self.observation_space = Box(low=-np.inf, high=np.inf, shape=(num_obs,), dtype=np.float32)
 
     def _get_obs(self):
-        drone_states = super()._get_obs()
+        drone_states = self.states
         out_obs = []
         for state in drone_states:
             xyz = state[:3]
@@ -70,7 +81,7 @@ class LocalFramePRYEnv(BaseDroneEnv):
             loc_vel = R @ glob_vel  # velocity in local frame
             obs_i = np.concatenate([loc_ref_err.squeeze(), rpy[:2][::-1], heading_diff, loc_vel.squeeze(), loc_ang_vel, pendulum_rp[::-1], pendulum_ang_vel])
             out_obs.append(obs_i)
-        return out_obs
+        return np.array(out_obs, dtype=np.float32)
 
 
 class LocalFrameFullStateEnv(BaseDroneEnv):
@@ -83,31 +94,22 @@ class LocalFrameFullStateEnv(BaseDroneEnv):
         self.num_states = 23
         self.num_params = 0
         num_obs = self.num_states + self.num_params
-        self.observation_space = Box(low=-np.inf, high=np.inf, shape=(num_obs,), dtype=np.float64)
+        self.observation_space = Box(low=-np.inf, high=np.inf, shape=(num_obs,), dtype=np.float32)
 
     def _get_obs(self):
-        drone_states = super()._get_obs()
-        out_obs = []
-        for state in drone_states:
-            xyz = state[:3]
-            rpy = state[3:6]
-            yaw = rpy[2]
-            vel = state[6:9]
-            loc_ang_vel = state[9:12]
-            pendulum_rp = state[12:14]
-            pendulum_ang_vel = state[14:16]
-            acc = state[16:19]
-            act = state[19:23]
-            # ref = state[23:27]
-            # params = state[27:]
-            heading_diff = np.array((self.reference[3] - yaw + np.pi) % (2 * np.pi) - np.pi)[None]  # yaw signed difference
-            glob_ref_err = np.array(self.reference[:3] - xyz)[None].T
-            R = mujoco_quat2DCM(mujoco_rpy2quat(rpy)).T
-            loc_ref_err = R @ glob_ref_err  # reference direction in local frame
-            glob_vel = np.array(vel)[None].T
-            loc_vel = R @ glob_vel  # velocity in local frame
-            obs_i = np.concatenate([loc_ref_err.squeeze(), rpy[:2][::-1], heading_diff, loc_vel.squeeze(), loc_ang_vel, acc, act, pendulum_rp[::-1], pendulum_ang_vel])
-            out_obs.append(obs_i)
+        drone_states = self.states
+        # state layout: xyz 0:3, rpy 3:6, vel 6:9, ang_vel 9:12, pendulum_rp 12:14, pendulum_ang_vel 14:16,
+        # acc 16:19, act 19:23, ref 23:27, params 27:
+        loc_ref_err, heading_diff, loc_vel = _local_frame_states(drone_states, self.reference)
+        out_obs = np.empty((len(drone_states), self.num_states + self.num_params), dtype=np.float32)
+        out_obs[:, 0:3] = loc_ref_err
+        out_obs[:, 3:5] = drone_states[:, 4:2:-1]  # pitch and roll
+        out_obs[:, 5] = heading_diff
+        out_obs[:, 6:9] = loc_vel
+        out_obs[:, 9:12] = drone_states[:, 9:12]  # angular velocity
+        out_obs[:, 12:19] = drone_states[:, 16:23]  # acceleration and actuation
+        out_obs[:, 19:21] = drone_states[:, 13:11:-1]  # pendulum pitch and roll
+        out_obs[:, 21:23] = drone_states[:, 14:16]  # pendulum angular velocity
         return out_obs
 
 
@@ -121,10 +123,10 @@ class LocalFrameFullStateZvecEnv(BaseDroneEnv):
         self.num_states = 23
         self.num_params = 0
         num_obs = self.num_states + self.num_params
-        self.observation_space = Box(low=-np.inf, high=np.inf, shape=(num_obs,), dtype=np.float64)
+        self.observation_space = Box(low=-np.inf, high=np.inf, shape=(num_obs,), dtype=np.float32)
 
     def _get_obs(self):
-        drone_states = super()._get_obs()
+        drone_states = self.states
         out_obs = []
         for state in drone_states:
             xyz = state[:3]
@@ -148,7 +150,7 @@ class LocalFrameFullStateZvecEnv(BaseDroneEnv):
             loc_vel = R @ glob_vel  # velocity in local frame
             obs_i = np.concatenate([loc_ref_err.squeeze(), z_vec, heading_diff, loc_vel.squeeze(), loc_ang_vel, acc, act, pendulum_rp[::-1], pendulum_ang_vel])
             out_obs.append(obs_i)
-        return out_obs
+        return np.array(out_obs, dtype=np.float32)
 
 
 class LocalFramePRYaccEnv(BaseDroneEnv):
@@ -162,32 +164,22 @@ class LocalFramePRYaccEnv(BaseDroneEnv):
         self.num_states = 19
         self.num_params = 0
         num_obs = self.num_states + self.num_params
-        self.observation_space = Box(low=-np.inf, high=np.inf, shape=(num_obs,), dtype=np.float64)
+        self.observation_space = Box(low=-np.inf, high=np.inf, shape=(num_obs,), dtype=np.float32)
 
     def _get_obs(self):
-        drone_states = super()._get_obs()
-        out_obs = []
-        for state in drone_states:
-            xyz = state[:3]
-            rpy = state[3:6]
-            yaw = rpy[2]
-            vel = state[6:9]
-            loc_ang_vel = state[9:12]
-            pendulum_rp = state[12:14]
-            pendulum_ang_vel = state[14:16]
-            acc = state[16:19]
-            # act = state[19:23]
-            # ref = state[23:27]
-            # params = state[27:]
-            heading_diff = np.array((self.reference[3] - yaw + np.pi) % (2 * np.pi) - np.pi)[None]  # yaw signed difference
-            glob_ref_err = np.array(self.reference[:3] - xyz)[None].T
-            R = mujoco_quat2DCM(mujoco_rpy2quat(rpy)).T
-            loc_ref_err = R @ glob_ref_err  # reference direction in local frame
-            glob_vel = np.array(vel)[None].T
-            loc_vel = R @ glob_vel  # velocity in local frame
-            obs_i = np.concatenate([loc_ref_err.squeeze(), rpy[:2][::-1], heading_diff, loc_vel.squeeze(),
-                                    loc_ang_vel, acc, pendulum_rp[::-1], pendulum_ang_vel])
-            out_obs.append(obs_i)
+        drone_states = self.states
+        # state layout: xyz 0:3, rpy 3:6, vel 6:9, ang_vel 9:12, pendulum_rp 12:14, pendulum_ang_vel 14:16,
+        # acc 16:19, act 19:23, ref 23:27, params 27:
+        loc_ref_err, heading_diff, loc_vel = _local_frame_states(drone_states, self.reference)
+        out_obs = np.empty((len(drone_states), self.num_states + self.num_params), dtype=np.float32)
+        out_obs[:, 0:3] = loc_ref_err
+        out_obs[:, 3:5] = drone_states[:, 4:2:-1]  # pitch and roll
+        out_obs[:, 5] = heading_diff
+        out_obs[:, 6:9] = loc_vel
+        out_obs[:, 9:12] = drone_states[:, 9:12]  # angular velocity
+        out_obs[:, 12:15] = drone_states[:, 16:19]  # acceleration
+        out_obs[:, 15:17] = drone_states[:, 13:11:-1]  # pendulum pitch and roll
+        out_obs[:, 17:19] = drone_states[:, 14:16]  # pendulum angular velocity
         return out_obs
 
 
@@ -202,10 +194,10 @@ class LocalFramePRYParamsEnv(BaseDroneEnv):
         self.num_states = 16
         self.num_params = 6
         num_obs = self.num_states + self.num_params
-        self.observation_space = Box(low=-np.inf, high=np.inf, shape=(num_obs,), dtype=np.float64)
+        self.observation_space = Box(low=-np.inf, high=np.inf, shape=(num_obs,), dtype=np.float32)
 
     def _get_obs(self):
-        drone_states = super()._get_obs()
+        drone_states = self.states
         out_obs = []
         for state in drone_states:
             xyz = state[:3]
@@ -227,7 +219,7 @@ class LocalFramePRYParamsEnv(BaseDroneEnv):
             loc_vel = R @ glob_vel  # velocity in local frame
             obs_i = np.concatenate([loc_ref_err.squeeze(), rpy[:2][::-1], heading_diff, loc_vel.squeeze(), loc_ang_vel, pendulum_rp[::-1], pendulum_ang_vel, params])
             out_obs.append(obs_i)
-        return out_obs
+        return np.array(out_obs, dtype=np.float32)
 
 
 class LocalFramePRYaccParamsEnv(BaseDroneEnv):
@@ -237,10 +229,10 @@ class LocalFramePRYaccParamsEnv(BaseDroneEnv):
         self.num_states = 19
         self.num_params = 6
         num_obs = self.num_states + self.num_params
-        self.observation_space = Box(low=-np.inf, high=np.inf, shape=(num_obs,), dtype=np.float64)
+        self.observation_space = Box(low=-np.inf, high=np.inf, shape=(num_obs,), dtype=np.float32)
 
     def _get_obs(self):
-        drone_states = super()._get_obs()
+        drone_states = self.states
         out_obs = []
         for state in drone_states:
             xyz = state[:3]
@@ -262,7 +254,7 @@ class LocalFramePRYaccParamsEnv(BaseDroneEnv):
             loc_vel = R @ glob_vel  # velocity in local frame
             obs_i = np.concatenate([loc_ref_err.squeeze(), rpy[:2][::-1], heading_diff, loc_vel.squeeze(), loc_ang_vel, pendulum_rp[::-1], acc, pendulum_ang_vel, params])
             out_obs.append(obs_i)
-        return out_obs
+        return np.array(out_obs, dtype=np.float32)
 
 
 class LocalFrameRPYParamsEnv(BaseDroneEnv):
@@ -276,31 +268,20 @@ class LocalFrameRPYParamsEnv(BaseDroneEnv):
         self.num_states = 16
         self.num_params = 6
         num_obs = self.num_states + self.num_params
-        self.observation_space = Box(low=-np.inf, high=np.inf, shape=(num_obs,), dtype=np.float64)
+        self.observation_space = Box(low=-np.inf, high=np.inf, shape=(num_obs,), dtype=np.float32)
 
     def _get_obs(self):
-        drone_states = super()._get_obs()
-        out_obs = []
-        for state in drone_states:
-            xyz = state[:3]
-            rpy = state[3:6]
-            yaw = rpy[2]
-            vel = state[6:9]
-            loc_ang_vel = state[9:12]
-            pendulum_rp = state[12:14]
-            pendulum_ang_vel = state[14:16]
-            # acc = state[16:19]
-            # act = state[19:23]
-            # ref = state[23:27]
-            params = state[27:]
-            heading_diff = np.array((self.reference[3] - yaw + np.pi) % (2 * np.pi) - np.pi)[None]  # yaw signed difference
-            glob_ref_err = np.array(self.reference[:3] - xyz)[None].T
-            R = mujoco_quat2DCM(mujoco_rpy2quat(rpy)).T
-            loc_ref_err = R @ glob_ref_err  # reference direction in local frame
-            glob_vel = np.array(vel)[None].T
-            loc_vel = R @ glob_vel  # velocity in local frame
-            obs_i = np.concatenate([loc_ref_err.squeeze(), rpy[:2], heading_diff, loc_vel.squeeze(), loc_ang_vel, pendulum_rp, pendulum_ang_vel, params])
-            out_obs.append(obs_i)
+        drone_states = self.states
+        # state layout: xyz 0:3, rpy 3:6, vel 6:9, ang_vel 9:12, pendulum_rp 12:14, pendulum_ang_vel 14:16,
+        # acc 16:19, act 19:23, ref 23:27, params 27:
+        loc_ref_err, heading_diff, loc_vel = _local_frame_states(drone_states, self.reference)
+        out_obs = np.empty((len(drone_states), self.num_states + self.num_params), dtype=np.float32)
+        out_obs[:, 0:3] = loc_ref_err
+        out_obs[:, 3:5] = drone_states[:, 3:5]  # roll and pitch
+        out_obs[:, 5] = heading_diff
+        out_obs[:, 6:9] = loc_vel
+        out_obs[:, 9:16] = drone_states[:, 9:16]  # angular velocity, pendulum rp angles and angular velocity
+        out_obs[:, 16:] = drone_states[:, 27:]  # drone model parameters
         return out_obs
 
 
@@ -315,10 +296,10 @@ class LocalFrameRPYFakeParamsEnv(BaseDroneEnv):
         self.num_states = 16
         self.num_params = 6
         num_obs = self.num_states + self.num_params
-        self.observation_space = Box(low=-np.inf, high=np.inf, shape=(num_obs,), dtype=np.float64)
+        self.observation_space = Box(low=-np.inf, high=np.inf, shape=(num_obs,), dtype=np.float32)
 
     def _get_obs(self):
-        drone_states = super()._get_obs()
+        drone_states = self.states
         out_obs = []
         for state in drone_states:
             xyz = state[:3]
@@ -341,7 +322,7 @@ class LocalFrameRPYFakeParamsEnv(BaseDroneEnv):
             loc_vel = R @ glob_vel  # velocity in local frame
             obs_i = np.concatenate([loc_ref_err.squeeze(), rpy[:2], heading_diff, loc_vel.squeeze(), loc_ang_vel, pendulum_rp, pendulum_ang_vel, params])
             out_obs.append(obs_i)
-        return out_obs
+        return np.array(out_obs, dtype=np.float32)
 
 
 class LocalFrameRPYEnv(BaseDroneEnv):
@@ -354,10 +335,10 @@ class LocalFrameRPYEnv(BaseDroneEnv):
         self.num_states = 16
         self.num_params = 0
         num_obs = self.num_states + self.num_params
-        self.observation_space = Box(low=-np.inf, high=np.inf, shape=(num_obs,), dtype=np.float64)
+        self.observation_space = Box(low=-np.inf, high=np.inf, shape=(num_obs,), dtype=np.float32)
 
     def _get_obs(self):
-        drone_states = super()._get_obs()
+        drone_states = self.states
         out_obs = []
         for state in drone_states:
             xyz = state[:3]
@@ -379,7 +360,7 @@ class LocalFrameRPYEnv(BaseDroneEnv):
             loc_vel = R @ glob_vel  # velocity in local frame
             obs_i = np.concatenate([loc_ref_err.squeeze(), rpy[:2], heading_diff, loc_vel.squeeze(), loc_ang_vel, pendulum_rp, pendulum_ang_vel])
             out_obs.append(obs_i)
-        return out_obs
+        return np.array(out_obs, dtype=np.float32)
 
 
 class LocalFramePRYaccNoPendEnv(BaseDroneEnv):
@@ -390,10 +371,10 @@ class LocalFramePRYaccNoPendEnv(BaseDroneEnv):
         self.num_states = 15
         self.num_params = 0
         num_obs = self.num_states + self.num_params
-        self.observation_space = Box(low=-np.inf, high=np.inf, shape=(num_obs,), dtype=np.float64)
+        self.observation_space = Box(low=-np.inf, high=np.inf, shape=(num_obs,), dtype=np.float32)
 
     def _get_obs(self):
-        drone_states = super()._get_obs()
+        drone_states = self.states
         out_obs = []
         for state in drone_states:
             xyz = state[:3]
@@ -413,7 +394,7 @@ class LocalFramePRYaccNoPendEnv(BaseDroneEnv):
             loc_vel = R @ glob_vel  # velocity in local frame
             obs_i = np.concatenate([loc_ref_err.squeeze(), rpy[:2][::-1], heading_diff, loc_vel.squeeze(), loc_ang_vel, acc])
             out_obs.append(obs_i)
-        return out_obs
+        return np.array(out_obs, dtype=np.float32)
 
 
 class LocalFramePRYaccParamsNoPendEnv(BaseDroneEnv):
@@ -424,10 +405,10 @@ class LocalFramePRYaccParamsNoPendEnv(BaseDroneEnv):
         self.num_states = 15
         self.num_params = 6
         num_obs = self.num_states + self.num_params
-        self.observation_space = Box(low=-np.inf, high=np.inf, shape=(num_obs,), dtype=np.float64)
+        self.observation_space = Box(low=-np.inf, high=np.inf, shape=(num_obs,), dtype=np.float32)
 
     def _get_obs(self):
-        drone_states = super()._get_obs()
+        drone_states = self.states
         out_obs = []
         for state in drone_states:
             xyz = state[:3]
@@ -447,7 +428,7 @@ class LocalFramePRYaccParamsNoPendEnv(BaseDroneEnv):
             loc_vel = R @ glob_vel  # velocity in local frame
             obs_i = np.concatenate([loc_ref_err.squeeze(), rpy[:2][::-1], heading_diff, loc_vel.squeeze(), loc_ang_vel, acc, params])
             out_obs.append(obs_i)
-        return out_obs
+        return np.array(out_obs, dtype=np.float32)
 
 
 class LocalFrameRmParamsEnv(BaseDroneEnv):
@@ -460,10 +441,10 @@ class LocalFrameRmParamsEnv(BaseDroneEnv):
         self.num_states = 22
         self.num_params = 6
         num_obs = self.num_states + self.num_params
-        self.observation_space = Box(low=-np.inf, high=np.inf, shape=(num_obs,), dtype=np.float64)
+        self.observation_space = Box(low=-np.inf, high=np.inf, shape=(num_obs,), dtype=np.float32)
 
     def _get_obs(self):
-        drone_states = super()._get_obs()
+        drone_states = self.states
         out_obs = []
         for state in drone_states:
             xyz = state[:3]
@@ -486,7 +467,7 @@ class LocalFrameRmParamsEnv(BaseDroneEnv):
             loc_vel = R @ glob_vel  # velocity in local frame
             obs_i = np.concatenate([loc_ref_err.squeeze(), Rm.flatten(), loc_vel.squeeze(), loc_ang_vel, pendulum_rp, pendulum_ang_vel, params])
             out_obs.append(obs_i)
-        return out_obs
+        return np.array(out_obs, dtype=np.float32)
 
 
 class LocalFrameZvecEnv(BaseDroneEnv):
@@ -499,10 +480,10 @@ class LocalFrameZvecEnv(BaseDroneEnv):
         self.num_states = 17
         self.num_params = 0
         num_obs = self.num_states + self.num_params
-        self.observation_space = Box(low=-np.inf, high=np.inf, shape=(num_obs,), dtype=np.float64)
+        self.observation_space = Box(low=-np.inf, high=np.inf, shape=(num_obs,), dtype=np.float32)
 
     def _get_obs(self):
-        drone_states = super()._get_obs()
+        drone_states = self.states
         out_obs = []
         for state in drone_states:
             xyz = state[:3]
@@ -526,4 +507,4 @@ class LocalFrameZvecEnv(BaseDroneEnv):
             loc_vel = R @ glob_vel  # velocity in local frame
             obs_i = np.concatenate([loc_ref_err.squeeze(), z_vec, heading_diff, loc_vel.squeeze(), loc_ang_vel, pendulum_rp, pendulum_ang_vel])
             out_obs.append(obs_i)
-        return out_obs
\ No newline at end of file
+        return np.array(out_obs, dtype=np.float32)
\ No newline at end of file
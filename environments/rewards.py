@@ -10,6 +10,13 @@ def default_reward_fcn(env, state, action, num_steps):
     return reward
 
 
+def default_reward_fcn_batch(env, states, actions, num_steps):
+    # batched default_reward_fcn over all drones
+    ref = np.asarray(env.reference)
+    pos_err = np.linalg.norm(states[:, :3] - ref[:3], axis=1)
+    return 3 - pos_err
+
+
 def distance_reward_fcn(env, state, action, num_steps):
     # penalize distance from reference
     ref = env.reference
@@ -31,6 +38,17 @@ def distance_energy_reward(env, state, action, num_steps):
     return reward
 
 
+def distance_energy_reward_batch(env, states, actions, num_steps):
+    # batched distance_energy_reward over all drones
+    ref = np.asarray(env.reference)
+    heading_err = np.abs(states[:, 5] - ref[3])
+    heading_err = np.abs((heading_err + np.pi) % (2 * np.pi) - np.pi)
+    pos_err = ((states[:, :3] - ref[:3]) ** 2).sum(axis=1)
+    ctrl_effort = (actions ** 2).sum(axis=1)
+    rewards = 3.5 - pos_err - 0.1*heading_err - 0.2*ctrl_effort
+    return rewards
+
+
 def distance_energy_reward_pendulum_angle(env, state, action, num_steps):
     # penalize distance and action magnitude
     ref = env.reference
@@ -365,4 +383,9 @@ def reward_3(env, state, action, num_steps):
     pos_err = ((state[:3] - ref[:3]) ** 2).sum()
     ctrl_effort = (np.minimum(np.array(action) - 0.5, 0) ** 2).sum()
     reward = 4 - pos_err - 0.2*heading_err - 0.006*num_steps*(pos_err + 0.2*heading_err + 0.01*pendulum_energy) - 0.1*ctrl_effort - 0.1*pendulum_energy
-    return reward
\ No newline at end of file
+    return reward
+
+
+# batched counterparts of the per drone reward functions, used by the environment when available
+batch_reward_fcns = {default_reward_fcn: default_reward_fcn_batch,
+                     distance_energy_reward: distance_energy_reward_batch}
@@ -0,0 +1,119 @@
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+from ray.rllib.env.vector_env import VectorEnv
+from ray.rllib.env.env_context import EnvContext
+
+
+def _worker(index, env_class, config, pipe):
+    """runs one drone environment in a subprocess, the observations, rewards and truncations are written into its slice
+    of the shared memory blocks and the actions are read from there, the pipe only carries short commands"""
+    env = env_class(config)
+    pipe.send((env.observation_space, env.action_space))
+    specs = pipe.recv()  # name, shape and dtype of the shared memory blocks
+    blocks = [shared_memory.SharedMemory(name=name) for name, _, _ in specs]
+    obs, actions, rewards, truncated = [np.ndarray(shape, dtype=dtype, buffer=block.buf)[index]
+                                        for block, (_, shape, dtype) in zip(blocks, specs)]
+    while True:
+        command, arg = pipe.recv()
+        if command == 'step':
+            ob, reward, _, truncate, _ = env.vector_step(actions)
+            obs[:], rewards[:], truncated[:] = ob, reward, truncate
+        elif command == 'reset':
+            obs[:] = env.vector_reset()[0]
+        elif command == 'reset_at':
+            obs[arg] = env.reset_at(arg)[0]
+        elif command == 'close':
+            break
+        pipe.send(None)
+    env.close()
+    del obs, actions, rewards, truncated  # release the views before closing the shared memory
+    for block in blocks:
+        block.close()
+    pipe.send(None)
+
+
+class SharedMemoryVectorEnv(VectorEnv):
+    """Runs num_processes drone environments in subprocesses and exposes all their drones as a single rllib VectorEnv.
+    Observations, actions, rewards and truncations are exchanged through shared memory instead of being pickled.
+    The drone environment class is given by the env_class config entry, every subprocess gets the rest of the config."""
+
+    def __init__(self, config):
+        env_class = config['env_class']
+        self.num_processes = config.get('num_processes', 1)
+        self.drones_per_process = config.get('num_drones', 1)
+        worker_index = getattr(config, 'worker_index', 0)
+
+        # start the subprocesses, spawn avoids forking the threads of the rllib worker
+        ctx = mp.get_context('spawn')
+        self._pipes, self._processes = [], []
+        for p in range(self.num_processes):
+            # give every subprocess its own index, it is used for seeding and for toggling visualization
+            sub_config = EnvContext(dict(config), worker_index=max(worker_index - 1, 0)*self.num_processes + p + 1,
+                                    vector_index=p)
+            pipe, child_pipe = ctx.Pipe()
+            process = ctx.Process(target=_worker, args=(p, env_class, sub_config, child_pipe), daemon=True)
+            process.start()
+            child_pipe.close()
+            self._pipes.append(pipe)
+            self._processes.append(process)
+        observation_space, action_space = [pipe.recv() for pipe in self._pipes][0]
+
+        # allocate shared memory with a slice per subprocess
+        shape = (self.num_processes, self.drones_per_process)
+        specs = [(shape + observation_space.shape, observation_space.dtype),  # observations
+                 (shape + action_space.shape, action_space.dtype),  # actions
+                 (shape, np.float64),  # rewards
+                 (shape, np.bool_)]  # truncations
+        self._blocks = [shared_memory.SharedMemory(create=True, size=int(np.prod(s)) * np.dtype(dtype).itemsize)
+                        for s, dtype in specs]
+        self._obs, self._actions, self._rewards, self._truncated = [
+            np.ndarray(s, dtype=dtype, buffer=block.buf) for block, (s, dtype) in zip(self._blocks, specs)]
+        for pipe in self._pipes:
+            pipe.send([(block.name, s, np.dtype(dtype).str) for block, (s, dtype) in zip(self._blocks, specs)])
+
+        VectorEnv.__init__(self, observation_space, action_space, self.num_processes * self.drones_per_process)
+
+    def _command(self, command, arg=None, processes=None):
+        """sends a command to the given subprocesses (all by default) and waits until they are done"""
+        pipes = self._pipes if processes is None else [self._pipes[p] for p in processes]
+        for pipe in pipes:
+            pipe.send((command, arg))
+        for pipe in pipes:
+            pipe.recv()
+
+    def vector_step(self, actions):
+        """writes the actions of all drones into shared memory and steps all the subprocesses"""
+        self._actions.reshape(self.num_envs, -1)[:] = np.asarray(actions)
+        self._command('step')
+        # rllib keeps references to the returned observations, so hand out a copy of the shared buffer
+        obs = self._obs.reshape(self.num_envs, -1).copy()
+        rewards = self._rewards.ravel().tolist()
+        truncated = self._truncated.ravel().tolist()
+        return obs, rewards, [False]*self.num_envs, truncated, [{}]*self.num_envs
+
+    def vector_reset(self, seeds=None, options=None):
+        """reset all the drones in all the subprocesses"""
+        self._command('reset')
+        return self._obs.reshape(self.num_envs, -1).copy(), [{}]*self.num_envs
+
+    def reset_at(self, index, seed=None, options=None):
+        """reset state of a drone given by its index"""
+        if index is None:
+            index = 0
+        p, i = divmod(index, self.drones_per_process)
+        self._command('reset_at', i, processes=[p])
+        return self._obs[p, i].copy(), {}
+
+    def close(self):
+        """stops the subprocesses and releases the shared memory"""
+        if not self._processes:
+            return
+        self._command('close')
+        for process in self._processes:
+            process.join()
+        self._processes = []
+        del self._obs, self._actions, self._rewards, self._truncated
+        for block in self._blocks:
+            block.close()
+            block.unlink()
@@ -15,13 +15,58 @@ def mujoco_quat2DCM(quat):
 
 def mujoco_quat2rpy(quat):
     """convert from mujoco quaternion to roll pitch and yaw angles"""
-    return R.from_quat(np.append(quat[1:], quat[0])).as_euler('ZYX')[::-1]
+    return mujoco_quat2rpy_batch(np.asarray(quat, dtype=np.float64)[None])[0]
+
+
+def mujoco_quat2rpy_batch(quats):
+    """convert an (N, 4) array of mujoco quaternions to an (N, 3) array of roll pitch and yaw angles"""
+    quats = np.asarray(quats, dtype=np.float64)
+    quats = quats / np.linalg.norm(quats, axis=1, keepdims=True)
+    w, x, y, z = quats[:, 0], quats[:, 1], quats[:, 2], quats[:, 3]
+    rpy = np.empty((quats.shape[0], 3))
+    rpy[:, 0] = np.arctan2(2 * (w * x + y * z), 1 - 2 * (x * x + y * y))
+    rpy[:, 1] = np.arcsin(np.clip(2 * (w * y - z * x), -1, 1))
+    rpy[:, 2] = np.arctan2(2 * (w * z + x * y), 1 - 2 * (y * y + z * z))
+    return rpy
 
 
 def mujoco_rpy2quat(rpy):
     """convert from roll pitch yaw angles to mujoco quaternion"""
-    quat = R.from_euler('ZYX', rpy[::-1]).as_quat()
-    return np.append(quat[3], quat[:3])
+    return mujoco_rpy2quat_batch(np.asarray(rpy, dtype=np.float64)[None])[0]
+
+
+def mujoco_rpy2quat_batch(rpys):
+    """convert an (N, 3) array of roll pitch yaw angles to an (N, 4) array of mujoco quaternions"""
+    rpys = np.asarray(rpys, dtype=np.float64)
+    cr, sr = np.cos(rpys[:, 0] / 2), np.sin(rpys[:, 0] / 2)
+    cp, sp = np.cos(rpys[:, 1] / 2), np.sin(rpys[:, 1] / 2)
+    cy, sy = np.cos(rpys[:, 2] / 2), np.sin(rpys[:, 2] / 2)
+    quats = np.empty((rpys.shape[0], 4))
+    quats[:, 0] = cr * cp * cy + sr * sp * sy
+    quats[:, 1] = sr * cp * cy - cr * sp * sy
+    quats[:, 2] = cr * sp * cy + sr * cp * sy
+    quats[:, 3] = cr * cp * sy - sr * sp * cy
+    return quats
+
+
+def mujoco_rpy2DCM_batch(rpys):
+    """convert an (N, 3) array of roll pitch yaw angles to an (N, 3, 3) array of rotation matrices from the local to
+    the global frame"""
+    rpys = np.asarray(rpys, dtype=np.float64)
+    cr, sr = np.cos(rpys[:, 0]), np.sin(rpys[:, 0])
+    cp, sp = np.cos(rpys[:, 1]), np.sin(rpys[:, 1])
+    cy, sy = np.cos(rpys[:, 2]), np.sin(rpys[:, 2])
+    DCM = np.empty((rpys.shape[0], 3, 3))
+    DCM[:, 0, 0] = cy * cp
+    DCM[:, 0, 1] = cy * sp * sr - sy * cr
+    DCM[:, 0, 2] = cy * sp * cr + sy * sr
+    DCM[:, 1, 0] = sy * cp
+    DCM[:, 1, 1] = sy * sp * sr + cy * cr
+    DCM[:, 1, 2] = sy * sp * cr - cy * sr
+    DCM[:, 2, 0] = -sp
+    DCM[:, 2, 1] = cp * sr
+    DCM[:, 2, 2] = cp * cr
+    return DCM
 
 
 def mujoco_pendulumrp2quat(pendulum_rp):
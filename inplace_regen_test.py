@@ -0,0 +1,82 @@
+import numpy as np
+from mujoco import mju_quat2Mat
+from environments.env_gen import make_mjmodel, randomize_model_inplace
+
+# parameter means and spreads in the order of DRONE_PARAM_NAMES
+param_means = np.array([1.35, 0.17, 7.5, 0.01, 1.2, 0.3])
+param_spreads = np.array([0.15, 0.02, 1.5, 0.0025, 0.3, 0.05])
+rtol, atol = 1e-3, 1e-6  # the compiled models go through xml with 5 significant digits
+
+
+def sample_params(rng, num_drones, pendulum):
+    params = param_means + param_spreads*rng.uniform(-1, 1, size=(num_drones, len(param_means)))
+    params[:, 4:] *= pendulum  # pendulum length and weight mass are zero without pendulum
+    return params
+
+
+def inertial_rotation(model, body_id):
+    rot = np.empty(9)
+    mju_quat2Mat(rot, model.body_iquat[body_id])
+    return rot.reshape(3, 3)
+
+
+def full_inertia(model, body_id):
+    """inertia tensor of a body in the body frame, the principal axes of the compiler may be permuted"""
+    rot = inertial_rotation(model, body_id)
+    return rot @ np.diag(model.body_inertia[body_id]) @ rot.T
+
+
+def body_frame_aabb(model, body_id, aabb):
+    """bounding box given in the inertial frame of a body moved to the body frame, the inertial frames of the
+    compiler and of the in place update only differ by a permutation of the axes so the box stays axis aligned"""
+    rot = inertial_rotation(model, body_id)
+    return np.concatenate([model.body_ipos[body_id] + rot @ aabb[:3], np.abs(rot) @ aabb[3:]])
+
+
+def leaf_aabbs(model, body_id):
+    """body frame bounding boxes of the leaves of the bounding volume hierarchy of a body by their geom ids, the tree
+    structure itself depends on the geom layout at compile time"""
+    adr, num = model.body_bvhadr[body_id], model.body_bvhnum[body_id]
+    return {model.bvh_nodeid[k]: body_frame_aabb(model, body_id, model.bvh_aabb[k])
+            for k in range(adr, adr + num) if model.bvh_nodeid[k] >= 0}
+
+
+def compare_models(model, expected):
+    """compares the parameter dependent fields of a model modified in place with a freshly compiled one"""
+    errors = []
+
+    def check(name, actual, desired):
+        if not np.allclose(actual, desired, rtol=rtol, atol=atol):
+            errors.append('%s differs by %g' % (name, np.max(np.abs(np.asarray(actual) - desired))))
+
+    for field in ['body_mass', 'body_ipos', 'geom_size', 'geom_pos', 'geom_rbound', 'site_pos', 'site_size',
+                  'actuator_gear', 'actuator_dynprm', 'geom_aabb']:
+        if hasattr(model, field):
+            check(field, getattr(model, field), getattr(expected, field))
+    for body_id in range(model.nbody):
+        check('inertia of body %s' % model.body(body_id).name, full_inertia(model, body_id),
+              full_inertia(expected, body_id))
+        if hasattr(model, 'bvh_aabb') and model.body_bvhnum[body_id] > 0:
+            name = model.body(body_id).name
+            check('bvh root of body %s' % name,
+                  body_frame_aabb(model, body_id, model.bvh_aabb[model.body_bvhadr[body_id]]),
+                  body_frame_aabb(expected, body_id, expected.bvh_aabb[expected.body_bvhadr[body_id]]))
+            leaves, expected_leaves = leaf_aabbs(model, body_id), leaf_aabbs(expected, body_id)
+            for geom_id in expected_leaves:
+                check('bvh leaf of geom %d' % geom_id, leaves[geom_id], expected_leaves[geom_id])
+    return errors
+
+
+def test_randomize_model_inplace():
+    rng = np.random.default_rng(0)
+    for pendulum in [True, False]:
+        params_a, params_b = sample_params(rng, 4, pendulum), sample_params(rng, 4, pendulum)
+        model = make_mjmodel(params_a)
+        randomize_model_inplace(model, params_b)
+        errors = compare_models(model, make_mjmodel(params_b))
+        assert not errors, '\n'.join(errors)
+
+
+if __name__ == '__main__':
+    test_randomize_model_inplace()
+    print('in place regeneration matches the compiled models')
@@ -73,6 +73,7 @@ train_env_config['num_drones'] = train_drones  # set number of drones used per e
 train_env_config['window_title'] = 'training'
 train_env_config['regen_env_at_steps'] = 1024  # regenerate simulation after 2000 timesteps
 train_env_config['max_steps'] = 1024
+train_env_config['stagger_resets'] = True  # spread drone episode ends over time instead of resetting all at once
 train_env_config['train_vis'] = 1   # how many training windows to render and show
 train_env_config['seed'] = seed
 train_env_config['state_difficulty'] = 0.8
@@ -1,5 +1,6 @@
 from ray.rllib.algorithms.ppo import PPOConfig
 from environments.BaseDroneEnv import BaseDroneEnv, base_config
+from environments.shared_memory_vecenv import SharedMemoryVectorEnv
 from copy import copy
 from training import train
 import os
@@ -52,6 +53,7 @@ model_config = {
 num_epochs = 500
 train_drones = 64  # number of drones per training environment
 num_processes = 8  # number parallel envs used for training
+use_subprocesses = False  # run the envs as shared memory subprocesses of one rollout worker instead of a worker each
 rollout_length = 1024  # length of individual rollouts used in training
 train_batch_size = num_processes * train_drones * rollout_length  # total length of the training data batch
 
@@ -61,6 +63,7 @@ train_env_config['num_drones'] = train_drones  # set number of drones used per e
 train_env_config['window_title'] = 'training'
 train_env_config['regen_env_at_steps'] = 1024  # regenerate simulation after 2000 timesteps
 train_env_config['max_steps'] = 1024
+train_env_config['stagger_resets'] = True  # spread drone episode ends over time instead of resetting all at once
 train_env_config['train_vis'] = 1   # how many training windows to render and show
 train_env_config['seed'] = seed
 train_env_config['state_difficulty'] = 0.2
@@ -77,6 +80,17 @@ eval_env_config['max_steps'] = 2048
 eval_env_config['state_difficulty'] = 0.4
 eval_env_config['param_difficulty'] = 2.5
 
+if use_subprocesses:
+    train_env = SharedMemoryVectorEnv
+    num_rollout_workers = 1
+    train_env_config['env_class'] = environment  # environment run inside each of the shared memory subprocesses
+    train_env_config['num_processes'] = num_processes
+    eval_env_config['env_class'] = environment
+    eval_env_config['num_processes'] = 1
+else:
+    train_env = environment
+    num_rollout_workers = num_processes
+
 # define custom logging dir
 timestr = datetime.today().strftime("%d-%m_%H-%M")  # current time
 logdir_prefix = f"PPO_{model.__name__}_{environment.__name__}_{timestr}"
@@ -91,9 +105,9 @@ algo_config = PPOConfig() \
     .training(gamma=0.985, lambda_=0.96, lr=0.001, sgd_minibatch_size=train_batch_size//4, clip_param=0.2,
               train_batch_size=train_batch_size, model=model_config, num_sgd_iter=20) \
     .resources(num_gpus=1) \
-    .rollouts(num_rollout_workers=num_processes, rollout_fragment_length=rollout_length)\
+    .rollouts(num_rollout_workers=num_rollout_workers, rollout_fragment_length=rollout_length)\
     .framework(framework='torch') \
-    .environment(env=environment, env_config=train_env_config, normalize_actions=False)\
+    .environment(env=train_env, env_config=train_env_config, normalize_actions=False)\
     .exploration(explore=True, exploration_config={"type": "StochasticSampling", "random_timesteps": (1-load_checkpoint)*10000})\
     .debugging(seed=seed, logger_creator=custom_logger_creator(logdir))\
     .callbacks(callbacks_class=MyCallbacks)\